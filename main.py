@@ -1,11 +1,32 @@
-from typing import List, Dict, Optional
-import pandas as pd
-from openai import OpenAI
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator, Awaitable, Callable, Deque, List, Dict, Optional, Tuple
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, RateLimitError
 from pathlib import Path
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+import argparse
+import asyncio
+import contextlib
+import csv
+import functools
+import hashlib
+import json
+import multiprocessing
 import os
+import textwrap
+import time
+import diskcache
+import httpx
+import tiktoken
+from tenacity import RetryCallState, retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from dotenv import load_dotenv
 import logging
 
+# pandas and numpy are only needed by the in-memory modes and are slow to import,
+# so they are imported where used and the streaming mode never loads them
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,68 +34,493 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Configure OpenAI
-api_key = os.getenv("OPENAI_API_KEY")
+# Local OpenAI-compatible vLLM server, started with e.g.
+# python -m vllm.entrypoints.openai.api_server --model meta-llama/Llama-3.1-8B-Instruct --max-num-seqs 64
+vllm_base_url = os.getenv("VLLM_BASE_URL", "http://localhost:8000/v1")
+vllm_model = os.getenv("VLLM_MODEL", "meta-llama/Llama-3.1-8B-Instruct")
+
+
+def create_client(backend: str, max_connections: int) -> AsyncOpenAI:
+    """Create the API client for the OpenAI API or a local vLLM server.
+    
+    All requests share one HTTP/2 connection pool so they multiplex over a few
+    connections; it is sized for the highest concurrency the run can reach.
+    """
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    if backend == "vllm":
+        # The local server speaks HTTP/1.1, so requests queue for a connection for as long
+        # as generation takes; only the request itself is bounded by the timeout
+        http_client = httpx.AsyncClient(http2=True, timeout=httpx.Timeout(60.0, pool=None), limits=limits)
+        return AsyncOpenAI(base_url=vllm_base_url, api_key="EMPTY", http_client=http_client, max_retries=0)
+        
+    # Configure OpenAI
+    api_key = os.getenv("OPENAI_API_KEY")
+    
+    if not api_key:
+        raise ValueError("OpenAI API key not found in environment variables")
+        
+    http_client = httpx.AsyncClient(http2=True, timeout=httpx.Timeout(60.0), limits=limits)
+    # Retries are left to tenacity so that every 429 reaches the adaptive concurrency controller
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+# Account rate limits used to throttle requests before they are sent
+requests_per_minute = float(os.getenv("OPENAI_RPM_LIMIT", "500"))
+tokens_per_minute = float(os.getenv("OPENAI_TPM_LIMIT", "30000"))
+
+@functools.lru_cache(maxsize=None)
+def get_encoding() -> "tiktoken.Encoding":
+    """Load the tokenizer on first use, since it may need to be downloaded."""
+    return tiktoken.encoding_for_model("gpt-4o")
+
+# Descriptions longer than this are routed to the escalation model
+LONG_DESCRIPTION_CHARS = 2000
+
+# Bound decode length and latency; a single email fits comfortably under this
+MAX_EMAIL_TOKENS = 400
+EMAIL_TEMPERATURE = 0.5
+
+SYSTEM_PROMPT = "You are a student applying for an internship. You maintain a professional tone."
+
+# Strings pd.read_csv reads as missing by default, mirrored by the pandas-free stream mode
+CSV_NA_VALUES = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+])
+
+# Prefix of the text written to the output column when a request fails
+ERROR_PREFIX = "Error generating email: "
+
+# On-disk cache of generated emails so duplicate rows and reruns are free
+email_cache = diskcache.Cache(".email_cache")
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens the model will be billed for the given text."""
+    return len(get_encoding().encode(text))
+
+
+def build_prompt(company_name: str, company_description: str) -> str:
+    """Build the per-company message that follows the shared prefix messages."""
+    return "\n".join([
+        f"Company: {company_name}",
+        f"Description: {company_description}",
+        "Return only the customized email.",
+    ])
+
+
+# Instructions that follow the company list in a multi-company request
+BATCH_INSTRUCTIONS = (
+    "Customize the email separately for each company above. "
+    'Return a JSON object with a single key "emails" holding an array of '
+    '{"index": <company index>, "email": <customized email content>} objects, one per company.'
+)
+
+# Completion parameters of a multi-company request, besides max_tokens which scales with the rows
+BATCH_PARAMS: Dict[str, Any] = {"temperature": EMAIL_TEMPERATURE, "response_format": {"type": "json_object"}}
+
+
+def build_batch_prompt(rows: List[Tuple[int, str, str]]) -> str:
+    """Build the message that asks to customize the template for several companies at once."""
+    companies = json.dumps([
+        {"index": index, "company_name": company_name, "description": company_description}
+        for index, company_name, company_description in rows
+    ])
+    return "\n".join([f"Companies: {companies}", BATCH_INSTRUCTIONS])
+
+
+def parse_batch_emails(content: str) -> Dict[int, str]:
+    """Parse the emails out of a JSON response to a batch prompt."""
+    return {int(item["index"]): item["email"] for item in json.loads(content)["emails"]}
+
+
+def cached_email(func: Callable[..., Awaitable[str]]) -> Callable[..., Awaitable[str]]:
+    """Serve a generated email from the cache, calling the API only on a miss."""
+    @functools.wraps(func)
+    async def wrapper(self: "EmailCustomizer", company_name: str, company_description: str) -> str:
+        key = self._cache_key(company_name, company_description)
+        email = email_cache.get(key)
+        if email is None:
+            email = await func(self, company_name, company_description)
+            email_cache.set(key, email)
+        return email
+    return wrapper
+
+
+class RateLimiter:
+    """Token bucket tracking the available requests and tokens per minute."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_request_capacity = requests_per_minute
+        self.available_token_capacity = tokens_per_minute
+        self.last_update_time = time.monotonic()
+
+    def _refill(self) -> None:
+        """Refill both buckets based on the time elapsed since the last update."""
+        now = time.monotonic()
+        elapsed = now - self.last_update_time
+        self.available_request_capacity = min(
+            self.available_request_capacity + self.requests_per_minute * elapsed / 60.0,
+            self.requests_per_minute,
+        )
+        self.available_token_capacity = min(
+            self.available_token_capacity + self.tokens_per_minute * elapsed / 60.0,
+            self.tokens_per_minute,
+        )
+        self.last_update_time = now
+
+    def consume(self, tokens: int) -> bool:
+        """Take capacity for one request of the given size, returning False if not yet available."""
+        self._refill()
+        # A single oversized request can never fit the bucket, so let it through once it is full
+        tokens = min(tokens, self.tokens_per_minute)
+        if self.available_request_capacity >= 1 and self.available_token_capacity >= tokens:
+            self.available_request_capacity -= 1
+            self.available_token_capacity -= tokens
+            return True
+        return False
 
-if not api_key:
-    raise ValueError("OpenAI API key not found in environment variables")
 
-client = OpenAI(api_key=api_key)
+class AdaptiveConcurrencyLimiter:
+    """Concurrency limit tuned by AIMD from the rate limit errors observed in each window.
+    
+    The limit grows by one after every window without a 429 and is halved after any
+    window with one, converging on the concurrency the account can actually sustain.
+    New requests are also held back while a 429's retry-after is in effect.
+    """
+
+    def __init__(self, initial: int, maximum: int, window: float = 10.0):
+        self.limit = initial
+        self.maximum = maximum
+        self.window = window
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.successes: Deque[float] = deque()
+        self.rate_limit_errors: Deque[float] = deque()
+        # Cleared while new requests must wait out a retry-after
+        self.resume = asyncio.Event()
+        self.resume.set()
+        self.paused_until = 0.0
+        self.pause_task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> None:
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.resume.is_set() and self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def record_success(self) -> None:
+        self.successes.append(time.monotonic())
+
+    def record_rate_limit(self, retry_after: Optional[float]) -> None:
+        now = time.monotonic()
+        self.rate_limit_errors.append(now)
+        if retry_after and now + retry_after > self.paused_until:
+            self.paused_until = now + retry_after
+            if self.resume.is_set():
+                self.resume.clear()
+                self.pause_task = asyncio.create_task(self._pause())
+
+    async def _pause(self) -> None:
+        """Hold back new requests until the latest retry-after has passed."""
+        while (remaining := self.paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(remaining)
+        self.resume.set()
+        async with self.condition:
+            self.condition.notify_all()
+
+    async def control(self) -> None:
+        """Adjust the limit at the end of every window until cancelled."""
+        while True:
+            window_start = time.monotonic()
+            await asyncio.sleep(self.window)
+            for events in (self.successes, self.rate_limit_errors):
+                while events and events[0] < window_start:
+                    events.popleft()
+                    
+            if self.rate_limit_errors:
+                # In-flight requests finish normally; new ones wait until fewer than the limit are running
+                self.limit = max(1, self.limit // 2)
+                self.rate_limit_errors.clear()
+                logger.info(f"Rate limited, reducing concurrency to {self.limit}")
+            elif self.successes and self.limit < self.maximum:
+                self.limit += 1
+                logger.info(f"No rate limits in the last {self.window:.0f}s, raising concurrency to {self.limit}")
+                async with self.condition:
+                    self.condition.notify()
+
+    def close(self) -> None:
+        """Stop any pending retry-after pause."""
+        if self.pause_task is not None:
+            self.pause_task.cancel()
+
+
+def _record_rate_limit(retry_state: RetryCallState) -> None:
+    """Report a 429 to the customizer's concurrency controller before tenacity backs off."""
+    customizer = retry_state.args[0]
+    error = retry_state.outcome.exception()
+    if customizer.concurrency is None or not isinstance(error, RateLimitError):
+        return
+    retry_after = error.response.headers.get("retry-after")
+    try:
+        customizer.concurrency.record_rate_limit(float(retry_after) if retry_after else None)
+    except ValueError:
+        customizer.concurrency.record_rate_limit(None)
 
 
 class EmailCustomizer:
-    def __init__(self, file_path: str, generic_email: str):
+    def __init__(
+        self,
+        file_path: str,
+        generic_email: str,
+        backend: str = "openai",
+        max_concurrent: Optional[int] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        batch_size: Optional[int] = None,
+        checkpoint_every: int = 50,
+        executor: Optional[Executor] = None,
+    ):
         self.file_path = Path(file_path)
-        self.generic_email = generic_email
-        self.df: Optional[pd.DataFrame] = None
+        # Indentation and surrounding blank lines are billed as tokens, so drop them once here
+        self.generic_email = textwrap.dedent(generic_email).strip()
+        # Every request starts with these exact messages so OpenAI can serve them from its prompt cache
+        self.prefix_messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": "\n".join([
+                "Original email template:",
+                self.generic_email,
+                "",
+                "Please customize the email template for a specific company, "
+                "incorporating relevant details from the company name and description. "
+                "Keep the email professional and concise.",
+                "Here is the company information to tailor it to:",
+            ])},
+        ]
+        self.backend = backend
+        if backend == "vllm":
+            # Continuous batching on the server welcomes oversubscription and there are no rate limits
+            self.model = self.escalation_model = vllm_model
+            self.max_concurrent = max_concurrent or 128
+            self.rate_limiter = rate_limiter
+            # Packing rows only saves requests per minute; the server schedules each sequence separately
+            self.batch_size = batch_size or 1
+        else:
+            self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+            self.escalation_model = os.getenv("OPENAI_ESCALATION_MODEL", "gpt-4o")
+            self.max_concurrent = max_concurrent or 20
+            self.rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+            self.batch_size = batch_size or 5
+        # Only the rate limiter needs token counts, so backends without one never load the tokenizer
+        self.prefix_tokens = 0
+        if self.rate_limiter is not None:
+            self.prefix_tokens = sum(count_tokens(message["content"]) for message in self.prefix_messages)
+        # The adaptive concurrency limit can grow up to five times its starting value
+        self.max_concurrency = self.max_concurrent * 5
+        self.client = create_client(backend, self.max_concurrency)
+        self.concurrency: Optional[AdaptiveConcurrencyLimiter] = None
+        self.checkpoint_every = checkpoint_every
+        self.executor = executor
+        self.df: Optional["pd.DataFrame"] = None
+        self.output_path = self.file_path.with_name(f"{self.file_path.stem}_updated{self.file_path.suffix}")
+        self.partial_path = self.file_path.with_name(f"{self.file_path.stem}_partial.csv")
         
         if not self.file_path.exists():
             raise FileNotFoundError(f"csv file not found at {file_path}")
             
     def read_csv(self) -> None:
-        """Read the csv file into a pandas DataFrame."""
+        """Read the csv file into a pandas DataFrame.
+        
+        The parsed data is cached as a sibling parquet file, which is read instead of
+        the csv on later runs as long as it is newer than the csv.
+        """
+        import pandas as pd
+        
+        parquet_path = self.file_path.with_suffix(".parquet")
         try:
-            self.df = pd.read_csv(self.file_path)
+            if parquet_path.exists() and parquet_path.stat().st_mtime >= self.file_path.stat().st_mtime:
+                self.df = pd.read_parquet(parquet_path, engine="pyarrow")
+                logger.info(f"Successfully read cached parquet file with {len(self.df)} rows")
+                return
+                
+            # Arrow-backed columns keep strings compact instead of one Python object per cell
+            self.df = pd.read_csv(self.file_path, dtype_backend="pyarrow")
             logger.info(f"Successfully read csv file with {len(self.df)} rows")
+            self.df.to_parquet(parquet_path, engine="pyarrow", index=False)
         except Exception as e:
             logger.error(f"Error reading csv file: {str(e)}")
             raise
 
-    def generate_custom_email(self, company_name: str, company_description: str) -> str:
+    async def _offload(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run CPU-bound work in the executor so the event loop only handles I/O."""
+        if self.executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _build_messages(self, prompt: str) -> List[Dict[str, str]]:
+        """Append a per-company prompt to the shared prefix messages."""
+        return [*self.prefix_messages, {"role": "user", "content": prompt}]
+
+    def _select_model(self, *company_descriptions: str) -> str:
+        """Use the cheaper default model unless a description is long enough to need the larger one."""
+        if max(len(description) for description in company_descriptions) > LONG_DESCRIPTION_CHARS:
+            return self.escalation_model
+        return self.model
+
+    def _email_params(self) -> Dict[str, Any]:
+        """Completion parameters that keep a single email short and its latency predictable."""
+        return {"max_tokens": MAX_EMAIL_TOKENS, "temperature": EMAIL_TEMPERATURE, "stop": ["\n\n\n"]}
+
+    @retry(
+        # The SDK's own retries are disabled, so transient connection and server errors are retried here too
+        retry=retry_if_exception_type((RateLimitError, APIConnectionError, InternalServerError)),
+        wait=wait_random_exponential(min=1, max=60),
+        stop=stop_after_attempt(6),
+        before_sleep=_record_rate_limit,
+        reraise=True,
+    )
+    async def _create_completion(self, messages: List[Dict[str, str]], model: str, **kwargs: Any) -> str:
+        """Stream a chat completion and join its content, retrying on rate limit and transient errors."""
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            **kwargs,
+        )
+        chunks = []
+        async for event in stream:
+            if event.choices:
+                chunks.append(event.choices[0].delta.content or "")
+        if self.concurrency is not None:
+            self.concurrency.record_success()
+        return "".join(chunks)
+
+    async def _wait_for_capacity(self, prompt: str, max_tokens: int) -> None:
+        """Block until the rate limiter has room for a request with the given prompt and output budget."""
+        if self.rate_limiter is None:
+            return
+        tokens = self.prefix_tokens + await self._offload(count_tokens, prompt) + max_tokens
+        while not self.rate_limiter.consume(tokens):
+            await asyncio.sleep(0.05)
+
+    def _cache_key(self, company_name: str, company_description: str, model: Optional[str] = None) -> str:
+        """Hash the model, the full messages and the completion parameters into a cache key.
+        
+        A row's email is looked up under the same key whether it was generated alone or
+        packed with other rows, so the multi-company instructions and parameters are part
+        of the key too. Any change to the template, system prompt, either set of
+        instructions or the parameters therefore misses the cache instead of serving
+        emails generated under the old prompt.
+        """
+        request = {
+            "model": model or self._select_model(company_description),
+            "messages": self._build_messages(build_prompt(company_name, company_description)),
+            **self._email_params(),
+            "batch": {"instructions": BATCH_INSTRUCTIONS, "max_tokens_per_row": MAX_EMAIL_TOKENS, **BATCH_PARAMS},
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def _split_cached(self, rows: List[Tuple[int, str, str]]) -> Tuple[Dict[int, str], List[Tuple[int, str, str]]]:
+        """Separate the rows whose email is already cached from the ones still to generate."""
+        cached: Dict[int, str] = {}
+        remaining: List[Tuple[int, str, str]] = []
+        for index, company_name, company_description in rows:
+            email = email_cache.get(self._cache_key(company_name, company_description))
+            if email is None:
+                remaining.append((index, company_name, company_description))
+            else:
+                cached[index] = email
+        if cached:
+            logger.info(f"Reusing {len(cached)} cached emails")
+        return cached, remaining
+
+    @cached_email
+    async def _generate_email(self, company_name: str, company_description: str) -> str:
+        """Generate a customized email using OpenAI API, raising on failure."""
+        prompt = await self._offload(build_prompt, company_name, company_description)
+        
+        await self._wait_for_capacity(prompt, MAX_EMAIL_TOKENS)
+        return await self._create_completion(
+            self._build_messages(prompt), self._select_model(company_description), **self._email_params()
+        )
+
+    async def generate_custom_email(self, company_name: str, company_description: str) -> str:
         """Generate a customized email using OpenAI API."""
         try:
-            prompt = f"""
-            Original email template:
-            {self.generic_email}
-            
-            Company name:
-            {company_name}
-            
-            Company description:
-            {company_description}
-            
-            Please customize the email template for this specific company,
-            incorporating relevant details from the company name and description.
-            Keep the email professional and concise.
-            You will only output the customized email content.
-            """
-            
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a student applying for an internship. You maintain a professional tone."},
-                    {"role": "user", "content": prompt},
-                ],
+            return await self._generate_email(company_name, company_description)
+            
+        except Exception as e:
+            logger.error(f"Error generating custom email: {str(e)}")
+            return f"{ERROR_PREFIX}{str(e)}"
+
+    async def generate_custom_emails_batch(self, rows: List[Tuple[int, str, str]]) -> Dict[int, str]:
+        """Generate customized emails for several companies with a single OpenAI API call.
+        
+        Falls back to one request per company if the response cannot be parsed.
+        """
+        try:
+            prompt = await self._offload(build_batch_prompt, rows)
+            
+            max_tokens = MAX_EMAIL_TOKENS * len(rows)
+            model = self._select_model(*[company_description for _, _, company_description in rows])
+            
+            await self._wait_for_capacity(prompt, max_tokens)
+            content = await self._create_completion(
+                self._build_messages(prompt),
+                model,
+                max_tokens=max_tokens,
+                **BATCH_PARAMS,
             )
             
-            return response.choices[0].message.content
+            emails = await self._offload(parse_batch_emails, content)
+            if any(index not in emails for index, _, _ in rows):
+                raise ValueError("response is missing emails for some companies")
+            for index, company_name, company_description in rows:
+                email_cache.set(self._cache_key(company_name, company_description, model), emails[index])
+            return {index: emails[index] for index, _, _ in rows}
             
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Could not parse batched response, falling back to single requests: {str(e)}")
         except Exception as e:
-            logger.error(f"Error generating custom email: {str(e)}")
-            return f"Error generating email: {str(e)}"
+            logger.error(f"Error generating batched custom emails: {str(e)}")
+            return {index: f"{ERROR_PREFIX}{str(e)}" for index, _, _ in rows}
+            
+        custom_emails = await asyncio.gather(*[
+            self.generate_custom_email(company_name, company_description)
+            for _, company_name, company_description in rows
+        ])
+        return {index: email for (index, _, _), email in zip(rows, custom_emails)}
 
-    def process_spreadsheet(self) -> None:
-        """Process the entire spreadsheet and generate custom emails."""
+    @contextlib.asynccontextmanager
+    async def _adaptive_concurrency(self) -> AsyncIterator[AdaptiveConcurrencyLimiter]:
+        """Run an adaptive concurrency limit, starting at max_concurrent, for the duration of the block."""
+        self.concurrency = AdaptiveConcurrencyLimiter(self.max_concurrent, self.max_concurrency)
+        controller = asyncio.create_task(self.concurrency.control())
+        try:
+            yield self.concurrency
+        finally:
+            controller.cancel()
+            self.concurrency.close()
+            self.concurrency = None
+
+    async def _bounded_generate(self, rows: List[Tuple[int, str, str]]) -> Dict[int, str]:
+        """Generate customized emails for a chunk of rows while holding a slot of the concurrency limit."""
+        async with self.concurrency:
+            logger.info(f"Processing rows {', '.join(str(index + 1) for index, _, _ in rows)}")
+            if len(rows) == 1:
+                index, company_name, company_description = rows[0]
+                return {index: await self.generate_custom_email(company_name, company_description)}
+            return await self.generate_custom_emails_batch(rows)
+
+    def _collect_rows(self) -> Tuple[List[Tuple[int, str, str]], str]:
+        """Collect the rows to customize and the name of the output column."""
+        import numpy as np
+        import pandas as pd
+        
         if self.df is None:
             self.read_csv()
             
@@ -82,40 +528,361 @@ class EmailCustomizer:
         if len(self.df.columns) < 4:
             raise ValueError("Spreadsheet must have at least 4 columns")
             
-        company_name_column = self.df.columns[0]  # Get first column name
-        description_column = self.df.columns[3]  # Get fourth column name
+        company_names = self.df.iloc[:, 0].to_numpy()  # First column
+        descriptions = self.df.iloc[:, 3].to_numpy()  # Fourth column
         output_column = self.df.columns[4] if len(self.df.columns) > 4 else 'Generated_Email'
             
-        # Process each row
-        for index, row in self.df.iterrows():
-            company_name = row[company_name_column]
-            company_description = row[description_column]
-            if pd.isna(company_description) or pd.isna(company_name):
-                continue
+        # Collect the rows that have both a company name and a description
+        mask = ~(pd.isna(company_names) | pd.isna(descriptions))
+        indices = np.flatnonzero(mask)
+        
+        # Dispatch in order of description length so rows packed together or in flight at the
+        # same time have similar prompt and output sizes; each row keeps its index for the results
+        lengths = np.fromiter((len(str(descriptions[i])) for i in indices), dtype=np.int64, count=len(indices))
+        indices = indices[np.argsort(lengths, kind="stable")]
+        rows = [(int(i), str(company_names[i]), str(descriptions[i])) for i in indices]
+            
+        return rows, output_column
+
+    def _initial_results(self, output_column: str) -> "np.ndarray":
+        """Start from the existing output values so skipped rows keep their content."""
+        import numpy as np
+        
+        if output_column in self.df.columns:
+            return self.df[output_column].to_numpy(dtype=object, copy=True)
+        return np.empty(len(self.df), dtype=object)
+
+    def _load_partial(self, rows: List[Tuple[int, str, str]]) -> Dict[int, str]:
+        """Read the emails completed by a previous interrupted run.
+        
+        Each checkpointed email carries the cache key of the request that produced it and
+        is only reused if the row at that index still produces the same key, so edits to
+        the csv, template or model in between do not put old emails into the wrong rows.
+        """
+        if not self.partial_path.exists():
+            return {}
+        keys = {index: self._cache_key(company_name, company_description) for index, company_name, company_description in rows}
+        completed: Dict[int, str] = {}
+        discarded = 0
+        with open(self.partial_path, newline="") as f:
+            for row in csv.reader(f):
+                if len(row) == 3 and row[0].isdigit() and keys.get(int(row[0])) == row[1]:
+                    completed[int(row[0])] = row[2]
+                else:
+                    discarded += 1
+        logger.info(f"Resuming with {len(completed)} emails completed in {self.partial_path}")
+        if discarded:
+            logger.warning(f"Ignoring {discarded} checkpointed emails that no longer match their rows")
+        return completed
+
+    async def process_spreadsheet(self) -> None:
+        """Process the entire spreadsheet and generate custom emails concurrently.
+        
+        Every finished email is appended to a partial csv and the spreadsheet is saved
+        every checkpoint_every emails, so an interrupted run resumes where it stopped.
+        """
+        rows, output_column = self._collect_rows()
+        completed = self._load_partial(rows)
+        cached, rows = self._split_cached([row for row in rows if row[0] not in completed])
+        
+        results = self._initial_results(output_column)
+        for result in (completed, cached):
+            for index, email in result.items():
+                results[index] = email
+            
+        # Pack rows into chunks so that each request customizes several emails, keeping rows
+        # that select different models apart so short rows are not escalated with long ones
+        by_model: Dict[str, List[Tuple[int, str, str]]] = {}
+        for row in rows:
+            by_model.setdefault(self._select_model(row[2]), []).append(row)
+        chunks = [
+            model_rows[i:i + self.batch_size]
+            for model_rows in by_model.values()
+            for i in range(0, len(model_rows), self.batch_size)
+        ]
+        
+        with open(self.partial_path, "a", newline="") as partial_file:
+            partial_writer = csv.writer(partial_file)
+            finished = 0
+            
+            async def run_chunk(chunk: List[Tuple[int, str, str]]) -> None:
+                nonlocal finished
+                result = await self._bounded_generate(chunk)
+                for index, company_name, company_description in chunk:
+                    email = results[index] = result[index]
+                    # Failed rows are left out so that a resumed run retries them
+                    if not email.startswith(ERROR_PREFIX):
+                        key = self._cache_key(company_name, company_description)
+                        partial_writer.writerow([index, key, email])
+                partial_file.flush()
+                
+                previous, finished = finished, finished + len(result)
+                if finished // self.checkpoint_every > previous // self.checkpoint_every:
+                    self.df[output_column] = results
+                    self.save_spreadsheet()
+                    
+            # Dispatch all requests at once, bounded by the adaptive concurrency limit
+            try:
+                async with self._adaptive_concurrency():
+                    await asyncio.gather(*[run_chunk(chunk) for chunk in chunks])
+            except (asyncio.CancelledError, KeyboardInterrupt):
+                # Keep the emails finished so far when the run is interrupted (e.g. Ctrl-C)
+                logger.info("Interrupted, saving the emails completed so far")
+                self.df[output_column] = results
+                self.save_spreadsheet()
+                raise
                 
-            logger.info(f"Processing row {index + 1}")
-            custom_email = self.generate_custom_email(
-                str(company_name),
-                str(company_description)
+        # Update the output column with all custom emails in one assignment
+        self.df[output_column] = results
+            
+        # Save the updated spreadsheet
+        self.save_spreadsheet()
+        self.partial_path.unlink()
+        
+    async def process_spreadsheet_batch(self, poll_interval: float = 30.0) -> None:
+        """Process the entire spreadsheet through the OpenAI Batch API.
+        
+        Batches are billed at a discount and are not subject to the synchronous rate
+        limits, at the cost of results arriving within the 24h completion window.
+        """
+        if self.backend != "openai":
+            raise ValueError("Batch mode is only available with the OpenAI backend")
+            
+        rows, output_column = self._collect_rows()
+        cached, rows = self._split_cached(rows)
+        results = self._initial_results(output_column)
+        for index, email in cached.items():
+            results[index] = email
+        if not rows:
+            logger.info("No rows to process")
+            self.df[output_column] = results
+            self.save_spreadsheet()
+            return
+            
+        # Write one chat completion request per row to a JSONL input file
+        input_path = self.file_path.with_name(f"{self.file_path.stem}_batch_input.jsonl")
+        with open(input_path, "w") as f:
+            for index, company_name, company_description in rows:
+                request = {
+                    "custom_id": str(index),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": self._select_model(company_description),
+                        "messages": self._build_messages(build_prompt(company_name, company_description)),
+                        **self._email_params(),
+                    },
+                }
+                f.write(json.dumps(request) + "\n")
+                
+        try:
+            with open(input_path, "rb") as f:
+                input_file = await self.client.files.create(file=f, purpose="batch")
+            batch = await self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
             )
+        finally:
+            # The uploaded copy is all the batch needs from here on
+            input_path.unlink()
+        logger.info(f"Submitted batch {batch.id} with {len(rows)} requests")
+        
+        # Poll until the batch reaches a terminal state
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+            logger.info(f"Batch {batch.id} is {batch.status}")
             
-            # Update the output column with the custom email
-            self.df.at[index, output_column] = custom_email
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.id} finished with status {batch.status}")
             
+        # Map each result back to its row through the custom_id
+        keys = {index: self._cache_key(company_name, company_description) for index, company_name, company_description in rows}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await self.client.files.content(file_id)
+            for line in content.text.splitlines():
+                result = json.loads(line)
+                index = int(result["custom_id"])
+                response = result.get("response") or {}
+                if result.get("error") or response.get("status_code") != 200:
+                    error = result.get("error") or response.get("body", {}).get("error")
+                    logger.error(f"Error generating custom email for row {index + 1}: {error}")
+                    results[index] = f"{ERROR_PREFIX}{error}"
+                else:
+                    results[index] = response["body"]["choices"][0]["message"]["content"]
+                    email_cache.set(keys[index], results[index])
+                    
+        # Update the output column with all custom emails in one assignment
+        self.df[output_column] = results
+        
         # Save the updated spreadsheet
         self.save_spreadsheet()
         
+    def _read_row_chunks(self, width: int, chunksize: int) -> Iterator[List[List[str]]]:
+        """Yield the data rows of the csv in chunks, padded to the given width.
+        
+        Cells and blank lines are treated the way pd.read_csv treats them, so stream mode
+        customizes the same rows as the in-memory modes: blank lines are skipped and the
+        default NA strings become empty cells.
+        """
+        with open(self.file_path, newline="") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            chunk: List[List[str]] = []
+            for values in reader:
+                if not values or (len(values) == 1 and not values[0].strip()):
+                    continue
+                values = ["" if value in CSV_NA_VALUES else value for value in values]
+                chunk.append(values + [""] * (width - len(values)))
+                if len(chunk) == chunksize:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    async def process_spreadsheet_streaming(self, chunksize: int = 1000) -> None:
+        """Process the spreadsheet as a stream without loading it into memory.
+        
+        A producer reads the csv in chunks and feeds a bounded queue, workers generate
+        the emails, and a writer appends finished rows to the output csv in their
+        original order. At most a fixed window of rows is read but not yet written, so
+        a stalled row holds back reading instead of letting later rows pile up in memory.
+        """
+        with open(self.file_path, newline="") as f:
+            header = next(csv.reader(f), [])
+        if len(header) < 4:
+            raise ValueError("Spreadsheet must have at least 4 columns")
+            
+        # Overwrite the fifth column if present, otherwise append a new one
+        output_position = 4
+        if len(header) == 4:
+            header.append('Generated_Email')
+            
+        pending_rows: asyncio.Queue = asyncio.Queue(maxsize=self.max_concurrent * 2)
+        finished_rows: asyncio.Queue = asyncio.Queue()
+        # One permit per row between being read and being written out
+        reorder_window = asyncio.Semaphore(2 * self.max_concurrency)
+        
+        async def produce() -> None:
+            chunks = self._read_row_chunks(len(header), chunksize)
+            index = 0
+            while True:
+                # Read the next chunk off the event loop so requests keep flowing meanwhile
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                for values in chunk:
+                    await reorder_window.acquire()
+                    if values[0] and values[3]:
+                        await pending_rows.put((index, values))
+                    else:
+                        await finished_rows.put((index, values))
+                    index += 1
+            for _ in range(self.concurrency.maximum):
+                await pending_rows.put(None)
+                
+        async def work() -> None:
+            while True:
+                item = await pending_rows.get()
+                if item is None:
+                    break
+                index, values = item
+                async with self.concurrency:
+                    logger.info(f"Processing row {index + 1}")
+                    values[output_position] = await self.generate_custom_email(str(values[0]), str(values[3]))
+                await finished_rows.put((index, values))
+                
+        async def write() -> None:
+            # Buffer out-of-order rows until every earlier row has been written
+            buffered: Dict[int, List[Any]] = {}
+            next_index = 0
+            with open(self.output_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                while True:
+                    item = await finished_rows.get()
+                    if item is None:
+                        break
+                    index, values = item
+                    buffered[index] = values
+                    while next_index in buffered:
+                        writer.writerow(buffered.pop(next_index))
+                        next_index += 1
+                        reorder_window.release()
+                    f.flush()
+                    
+        # Start enough workers for the highest concurrency the limit can grow to
+        writer_task = asyncio.create_task(write())
+        try:
+            async with self._adaptive_concurrency() as concurrency:
+                await asyncio.gather(produce(), *[work() for _ in range(concurrency.maximum)])
+        finally:
+            await finished_rows.put(None)
+            await writer_task
+        logger.info(f"Successfully streamed updated spreadsheet to {self.output_path}")
+        
     def save_spreadsheet(self) -> None:
         """Save the updated spreadsheet."""
         try:
-            output_path = self.file_path.with_name(f"{self.file_path.stem}_updated{self.file_path.suffix}")
-            self.df.to_csv(output_path, index=False)
-            logger.info(f"Successfully saved updated spreadsheet to {output_path}")
+            self.df.to_csv(self.output_path, index=False)
+            self.df.to_parquet(self.output_path.with_suffix(".parquet"), engine="pyarrow", index=False)
+            logger.info(f"Successfully saved updated spreadsheet to {self.output_path}")
         except Exception as e:
             logger.error(f"Error saving spreadsheet: {str(e)}")
             raise
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Customize a generic email for each company in a spreadsheet.")
+    parser.add_argument(
+        "--mode",
+        choices=["async", "batch", "stream"],
+        default="async",
+        help=(
+            "'async' sends concurrent requests, 'batch' submits an offline OpenAI Batch API job, "
+            "'stream' processes the csv chunk by chunk without loading it into memory"
+        ),
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["openai", "vllm"],
+        default="openai",
+        help="'openai' uses the OpenAI API, 'vllm' uses a local OpenAI-compatible vLLM server",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help=(
+            "number of worker processes for prompt building, token counting and JSON parsing; "
+            "only worth it at very high concurrency (default: 0, run them inline)"
+        ),
+    )
+    return parser.parse_args()
+
+def create_executor(workers: int) -> ProcessPoolExecutor:
+    """Start a process pool and bring its workers up before the event loop starts any threads."""
+    # Spawned rather than forked, since forking a process that runs threads is unsafe
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    list(executor.map(build_prompt, [""] * workers, [""] * workers))
+    return executor
+
+async def run(customizer: EmailCustomizer, mode: str) -> None:
+    """Run the customizer in the given mode and close its connection pool afterwards."""
+    try:
+        if mode == "batch":
+            await customizer.process_spreadsheet_batch()
+        elif mode == "stream":
+            await customizer.process_spreadsheet_streaming()
+        else:
+            await customizer.process_spreadsheet()
+    finally:
+        await customizer.client.close()
+
 def main():
+    args = parse_args()
     try:
         generic_email = """
         Dear Hiring Team,
@@ -132,9 +899,14 @@ def main():
         file_path = "spreadsheet.csv"
         generic_email = generic_email
 
-        customizer = EmailCustomizer(file_path, generic_email)
-        
-        customizer.process_spreadsheet()
+        executor = create_executor(args.workers) if args.workers > 0 else None
+        try:
+            customizer = EmailCustomizer(file_path, generic_email, backend=args.backend, executor=executor)
+            
+            asyncio.run(run(customizer, args.mode))
+        finally:
+            if executor is not None:
+                executor.shutdown()
         
         logger.info("Spreadsheet customization complete")
         